@@ -0,0 +1,19 @@
+import pandas as pd
+from sklearn.decomposition import PCA
+
+
+# large player pools: fit pca on a sample, rasterize points or draw density instead
+PCA_SAMPLE_SIZE = 5000
+RASTERIZE_MINIMUM = 2000
+HEXBIN_MINIMUM = 20000
+
+def fit_pca(X: pd.DataFrame, n_components: int) -> PCA:
+    """fit on at most PCA_SAMPLE_SIZE players"""
+    if len(X) > PCA_SAMPLE_SIZE:
+        X = X.sample(PCA_SAMPLE_SIZE, random_state=37)
+    return PCA(n_components).fit(X)
+
+def marker_size(n_points: int) -> tuple[int, bool]:
+    """return (scatter size, rasterized)"""
+    rasterized = n_points > RASTERIZE_MINIMUM
+    return (10 if rasterized else 100), rasterized
@@ -4,14 +4,17 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from sklearn.cluster import KMeans
-from sklearn.decomposition import PCA
-from sklearn.preprocessing import StandardScaler, power_transform
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline, make_pipeline
+from sklearn.preprocessing import PowerTransformer
 from sklearn.metrics import (
     silhouette_score, 
     calinski_harabasz_score, 
     davies_bouldin_score
 )
 
+from .plotting import HEXBIN_MINIMUM, fit_pca, marker_size
+
 
 III_DIR = Path('output/task_iii')
 
@@ -21,11 +24,8 @@ GK_STATS = [
     'gk_goals_against_per90', 'gk_save_pct', 'gk_clean_sheets_pct', 'gk_pens_save_pct'
 ]
 
-def process_data(players_df: pd.DataFrame) -> tuple[pd.DataFrame, pd.Series]: 
-    """fillna, yeo-johnson unskew, standardize
-        return processed data and skewness before unskewing
-    """
-
+def select_stats(players_df: pd.DataFrame) -> pd.DataFrame:
+    """numeric stats only, fillna 0 for outfielder's goal keeper stats"""
     df = players_df.copy()
 
     # fillna mean for goal keepers' goal keeper stats
@@ -34,12 +34,20 @@ def process_data(players_df: pd.DataFrame) -> tuple[pd.DataFrame, pd.Series]:
 
     # fillna 0 for outfielder's goal keeper stats
     df[GK_STATS] = df[GK_STATS].fillna(0)
-    df = df.fillna(df.mean())
-    skew_before = df.skew()
+    return df
 
-    data = power_transform(df, method='yeo-johnson') # unskew
-    data = StandardScaler().fit_transform(data)
-    return pd.DataFrame(data, columns=df.columns), skew_before
+def process_data(players_df: pd.DataFrame) -> tuple[pd.DataFrame, pd.Series, Pipeline]:
+    """fillna, yeo-johnson unskew, standardize
+        return processed data, skewness before unskewing and the fitted transformer
+    """
+    df = select_stats(players_df)
+    transformer = make_pipeline(
+        SimpleImputer(strategy='mean', keep_empty_features=True),
+        PowerTransformer(method='yeo-johnson', standardize=True) # unskew, standardize
+    )
+    data = transformer.fit_transform(df)
+    skew_before = pd.DataFrame(transformer[0].transform(df), columns=df.columns).skew()
+    return pd.DataFrame(data, columns=df.columns), skew_before, transformer
 
 # Task III.2
 
@@ -95,17 +103,156 @@ def grouping_players(X: pd.DataFrame) -> tuple[np.ndarray, pd.DataFrame]:
     return clusters, centers_df
 
 def scatter_pca_clusters_2d(X: pd.DataFrame, clusters: np.ndarray, centers_df: pd.DataFrame) -> plt.Figure:
-    pca = PCA(2)
-    X_pca = pca.fit_transform(X)
+    pca = fit_pca(X, 2)
+    X_pca = pca.transform(X)
     centers_pca = pca.transform(centers_df)
 
     plt.figure(figsize=(16, 8))
-    plt.scatter(X_pca[:, 0], X_pca[:, 1], c=clusters, cmap='tab10', s=100)
+    if len(X) > HEXBIN_MINIMUM:
+        # each hexagon colored by its most common cluster
+        plt.hexbin(X_pca[:, 0], X_pca[:, 1], C=clusters, gridsize=100, cmap='tab10',
+                   vmin=clusters.min(), vmax=clusters.max(), mincnt=1,
+                   reduce_C_function=lambda c: np.bincount(c).argmax())
+    else:
+        size, rasterized = marker_size(len(X))
+        plt.scatter(X_pca[:, 0], X_pca[:, 1], c=clusters, cmap='tab10', s=size, rasterized=rasterized)
     plt.scatter(centers_pca[:, 0], centers_pca[:, 1], c='black', s=1000, alpha=0.5)
     plt.title('2D Clusters Of Data Points')
     plt.tight_layout()
     return plt.gcf()
 
+# Similar Players Search
+
+N_SIMILAR = 10
+POSITIONS = ['GK', 'DF', 'MF', 'FW']
+BLOCK_SIZE = 1024
+
+class SimilarPlayersIndex:
+    """brute-force nearest neighbours search over processed data
+    - player key is (name, team), float32 matrix with cached squared norms, euclidean distance
+    - filter candidates by position or team with precomputed masks
+    - extend() transforms raw players with the fitted transformer, existing keys are replaced in place
+    - row arrays grow geometrically, only the first len(keys) rows are valid
+    """
+
+    def __init__(self, transformer: Pipeline, players_df: pd.DataFrame) -> None:
+        self.transformer = transformer
+        self.columns = transformer.feature_names_in_
+        self.keys: list[tuple[str, str]] = []
+        self.rows: dict[tuple[str, str], int] = {}
+        self.data = np.empty((0, len(self.columns)), dtype=np.float32)
+        self.norms = np.empty(0, dtype=np.float32)
+        self.position_masks = {position: np.empty(0, dtype=bool) for position in POSITIONS}
+        self.team_codes = np.empty(0, dtype=np.int32)
+        self.team_ids: dict[str, int] = {}
+        self.extend(players_df)
+
+    def reserve(self, n_rows: int) -> None:
+        """make room for n_rows, at least doubling the capacity"""
+        capacity = len(self.norms)
+        if n_rows <= capacity:
+            return
+        capacity = max(n_rows, 2 * capacity)
+
+        def grow(array: np.ndarray) -> np.ndarray:
+            grown = np.zeros((capacity, *array.shape[1:]), dtype=array.dtype)
+            grown[:len(array)] = array
+            return grown
+
+        self.data = grow(self.data)
+        self.norms = grow(self.norms)
+        self.team_codes = grow(self.team_codes)
+        self.position_masks = {position: grow(mask) for position, mask in self.position_masks.items()}
+
+    def extend(self, players_df: pd.DataFrame) -> None:
+        """add raw players (task i format), replace rows of players already in the index"""
+        players_df = players_df.drop_duplicates(['name', 'team'], keep='last')
+        if players_df.empty:
+            return
+        data = self.transformer.transform(select_stats(players_df)[self.columns]).astype(np.float32)
+        positions = players_df['position'].fillna('').astype(str)
+        teams = players_df['team'].astype(str)
+        for team in teams:
+            self.team_ids.setdefault(team, len(self.team_ids))
+
+        # existing keys are overwritten, new keys get appended rows
+        keys = list(zip(players_df['name'].astype(str), teams))
+        for key in keys:
+            if key not in self.rows:
+                self.rows[key] = len(self.keys)
+                self.keys.append(key)
+        self.reserve(len(self.keys))
+
+        rows = np.array([self.rows[key] for key in keys], dtype=np.intp)
+        self.data[rows] = data
+        self.norms[rows] = np.einsum('ij,ij->i', data, data)
+        self.team_codes[rows] = [self.team_ids[team] for team in teams]
+        for position in POSITIONS:
+            self.position_masks[position][rows] = positions.str.contains(position, regex=False).to_numpy()
+
+    def query(self, player: tuple[str, str], k: int = N_SIMILAR, position: str | None = None,
+              team: str | None = None) -> pd.DataFrame:
+        """return k most similar players to player (name, team), sorted by distance
+        - position: one of POSITIONS, 'MF' matches 'DF,MF'
+        - team: exact match
+        """
+        if position is not None and position not in POSITIONS:
+            raise ValueError(f'position must be one of {POSITIONS}, got {position!r}')
+
+        n = len(self.keys)
+        row = self.rows[player]
+        mask = np.ones(n, dtype=bool)
+        if position is not None:
+            mask &= self.position_masks[position][:n]
+        if team is not None:
+            mask &= self.team_codes[:n] == self.team_ids.get(team, -1)
+        mask[row] = False
+
+        candidates = np.flatnonzero(mask)
+        k = min(k, len(candidates))
+        if k == 0:
+            return pd.DataFrame(columns=['name', 'team', 'distance'])
+
+        # |a - b|^2 = |a|^2 - 2a.b + |b|^2
+        dists = self.norms[candidates] - 2 * (self.data[candidates] @ self.data[row]) + self.norms[row]
+        nearest = np.argpartition(dists, k - 1)[:k]
+        nearest = nearest[np.argsort(dists[nearest])]
+        names, teams = zip(*(self.keys[i] for i in candidates[nearest]))
+
+        return pd.DataFrame({
+            'name': names,
+            'team': teams,
+            'distance': np.sqrt(np.maximum(dists[nearest], 0)).round(3)
+        })
+
+    def all_nearest(self, k: int = N_SIMILAR) -> np.ndarray:
+        """rows of the k nearest players for every row, closest first, shape (n, min(k, n - 1))"""
+        n = len(self.keys)
+        k = min(k, n - 1)
+        nearest = np.empty((n, k), dtype=np.intp)
+        if k <= 0:
+            return nearest
+
+        data, norms = self.data[:n], self.norms[:n]
+        for start in range(0, n, BLOCK_SIZE):
+            stop = min(start + BLOCK_SIZE, n)
+            block = np.arange(start, stop)
+            dists = norms[block, None] - 2 * (data[block] @ data.T) + norms
+            dists[block - start, block] = np.inf # exclude self
+
+            part = np.argpartition(dists, k - 1, axis=1)[:, :k]
+            order = np.argsort(np.take_along_axis(dists, part, axis=1), axis=1)
+            nearest[start:stop] = np.take_along_axis(part, order, axis=1)
+        return nearest
+
+def find_similar_players(index: SimilarPlayersIndex) -> pd.DataFrame:
+    """N_SIMILAR most similar players for every player, closest first"""
+    nearest = index.all_nearest()
+    names = np.array([name for name, _ in index.keys], dtype=object)
+    df = pd.DataFrame(names[nearest], columns=range(1, nearest.shape[1] + 1))
+    df.insert(0, 'team', [team for _, team in index.keys])
+    df.insert(0, 'name', names)
+    return df
 
 def solve(players_df: pd.DataFrame) -> None: 
     III_DIR.mkdir(parents=True, exist_ok=True)
@@ -114,9 +261,10 @@ def solve(players_df: pd.DataFrame) -> None:
     clusters_evaluation_pdf = III_DIR / 'clusters_evaluation.pdf'
     player_groups_csv = III_DIR / 'player_groups.csv'
     pca_clusters_2d_pdf = III_DIR / 'pca_clusters_2d.pdf'
+    similar_players_csv = III_DIR / 'similar_players.csv'
     print('\nTask III:')
 
-    X, skew_before = process_data(players_df)
+    X, skew_before, transformer = process_data(players_df)
     X.to_csv(dataset_csv, encoding='utf-8') # no nan
     print(dataset_csv)
 
@@ -138,4 +286,9 @@ def solve(players_df: pd.DataFrame) -> None:
     pca_2d.savefig(pca_clusters_2d_pdf)
     print(pca_clusters_2d_pdf)
 
+    index = SimilarPlayersIndex(transformer, players_df)
+    similar_players = find_similar_players(index)
+    similar_players.to_csv(similar_players_csv, index=False, encoding='utf-8')
+    print(similar_players_csv)
+
     plt.close('all')
\ No newline at end of file
@@ -10,12 +10,13 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import NoSuchDriverException
-from sklearn.decomposition import PCA
 from sklearn.linear_model import LassoCV
 from sklearn.preprocessing import StandardScaler
 from sklearn.utils import resample
 from sklearn.metrics import r2_score, mean_squared_error
 
+from .plotting import HEXBIN_MINIMUM, fit_pca, marker_size
+
 
 IV_DIR = Path('output/task_iv')
 
@@ -114,15 +115,22 @@ def process_data(players_df: pd.DataFrame) -> pd.DataFrame:
     return pd.DataFrame(data, columns=df.columns)
 
 def scatter_pca_2d(X: pd.DataFrame, y: pd.Series) -> plt.Figure:
-    X_pca = PCA(1).fit_transform(X)[:, 0]
+    pca = fit_pca(X, 1)
+    X_pca = pca.transform(X)[:, 0]
 
     # fitting line
     coefs = np.polyfit(X_pca, y, 1)
     p = np.poly1d(coefs)
+    x_line = np.array([X_pca.min(), X_pca.max()])
 
     plt.figure(figsize=(16, 8))
-    plt.plot(X_pca, p(X_pca), c='red', linewidth=10)
-    plt.scatter(X_pca, y, c='black', s=100)
+    if len(X) > HEXBIN_MINIMUM:
+        plt.hexbin(X_pca, y, gridsize=100, cmap='Greys', bins='log', mincnt=1)
+        plt.colorbar(label='players')
+    else:
+        size, rasterized = marker_size(len(X))
+        plt.scatter(X_pca, y, c='black', s=size, rasterized=rasterized)
+    plt.plot(x_line, p(x_line), c='red', linewidth=10)
 
     plt.title('PCA 2D Map')
     plt.xlabel('player features')